@@ -1,26 +1,40 @@
 from __future__ import annotations
 
 import asyncio
-import base64
 import binascii
 import dataclasses
-import json
 import logging
 import os
 import re
 import secrets
 import time
+from collections import OrderedDict, deque
 from collections.abc import AsyncIterator
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
 from typing import Annotated, Literal
-from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+from urllib.parse import (
+    SplitResult,
+    parse_qsl,
+    urlencode,
+    urljoin,
+    urlsplit,
+    urlunsplit,
+)
 
 import httpx
+import orjson
+import pybase64
 from fastapi import Depends, FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from fastapi.responses import (
+    HTMLResponse,
+    ORJSONResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, ConfigDict, Field
+from starlette.background import BackgroundTask
 
 from noshitproxy.models import (
     FlowCompact,
@@ -41,9 +55,35 @@ _db_path = os.environ.get("NO_SHIT_PROXY_DB", "noshitproxy.sqlite3")
 store = Store(StoreConfig(db_path=_db_path))
 logger = logging.getLogger("noshitproxy")
 
-_CHARSET_RE = re.compile(r"charset=([^;]+)", re.IGNORECASE)
+_HEAD_OPEN_RE = re.compile(rb"<head[^>]*>", re.IGNORECASE)
+_HEAD_CLOSE_RE = re.compile(rb"</head>", re.IGNORECASE)
+
+# UTF-16 pages would need a real decode before splicing; they are rare enough
+# to just skip injection for.
+_UTF16_BOMS = (b"\xff\xfe", b"\xfe\xff")
+
+# index.html is read once at startup; serving it must not hit the filesystem
+# on every GET /.
+_index_html: bytes | None = None
+
+_SSE_RING_MAX = 500
+
 
-_subscribers: set[asyncio.Queue[str]] = set()
+class _SseSubscriber:
+    # A bounded deque plus a wakeup Event is much lighter than asyncio.Queue
+    # for fan-out: appends are plain C calls, and maxlen gives drop-oldest
+    # semantics without exceptions.
+    __slots__ = ("frames", "wakeup")
+
+    def __init__(self) -> None:
+        self.frames: deque[bytes] = deque(maxlen=_SSE_RING_MAX)
+        self.wakeup = asyncio.Event()
+
+
+# Copy-on-write snapshot: publish() reads the tuple without locking (attribute
+# loads are atomic in CPython); _sub_lock only serializes add/remove rebinds.
+# Rings carry fully framed SSE bytes so each event is encoded exactly once.
+_subscribers: tuple[_SseSubscriber, ...] = ()
 _sub_lock = asyncio.Lock()
 
 _HOP_BY_HOP_HEADERS = {
@@ -58,11 +98,72 @@ _HOP_BY_HOP_HEADERS = {
     "content-encoding",
 }
 
+# Byte-level twin of the set above, so raw header filtering can compare
+# without decoding keys that get dropped anyway.
+_HOP_BY_HOP_BYTES = frozenset(h.encode() for h in _HOP_BY_HOP_HEADERS)
+
+# Content types worth materializing resp_body_text for; anything else skips
+# the base64 + UTF-8 decode entirely at ingest. Structured-syntax suffixes
+# (application/xhtml+xml, image/svg+xml, application/vnd.*+json, ...) are
+# matched on the bare type, before any ; parameter.
+_TEXTISH_CT_PREFIXES = (
+    "text/",
+    "application/json",
+    "application/xml",
+    "application/javascript",
+)
+_TEXTISH_CT_SUFFIXES = ("+json", "+xml")
+
+# Shared upstream client: one connection pool for replays and repeats so we
+# pay DNS/TCP/TLS setup once per host instead of once per request.
+_http_client: httpx.AsyncClient | None = None
+
+
+class HttpClientNotOpenError(RuntimeError):
+    pass
+
+
+def _upstream_client() -> httpx.AsyncClient:
+    if _http_client is None:
+        raise HttpClientNotOpenError
+    return _http_client
+
+
+class ReplayEntry:
+    __slots__ = ("body", "headers", "method", "url")
+
+    def __init__(
+        self,
+        *,
+        method: str,
+        url: str,
+        headers: list[tuple[str, str]],
+        body: bytes,
+    ) -> None:
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.body = body
+
+
 _replay_lock = asyncio.Lock()
-_replay_requests: dict[str, tuple[float, str, str, list[tuple[str, str]], bytes]] = {}
+# Timestamps and payloads are kept apart so pruning only walks the compact
+# token->ts table; _replay_ts is insertion-ordered by creation time, so
+# expiry only ever looks at the head.
+_replay_ts: OrderedDict[str, float] = OrderedDict()
+_replay_data: dict[str, ReplayEntry] = {}
+_REPLAY_PRUNE_INTERVAL_S = 10.0
 _REPLAY_TTL_S = 60.0
 _REPLAY_PARAM = "__nsp"
 
+# Long-polling /api/scope waiters park on this event; set_scope swaps in a
+# fresh one after waking the current generation. The version counter lets a
+# poller that raced a change landing between its requests get the new scope
+# back immediately instead of parking a full window on the fresh event.
+_scope_changed = asyncio.Event()
+_scope_version = 0
+_SCOPE_WAIT_MAX_S = 60.0
+
 
 class FlowCompactIn(BaseModel):
     model_config = ConfigDict(extra="forbid")
@@ -98,6 +199,7 @@ class FlowListQuery(BaseModel):
     limit: int = Field(default=200, ge=1, le=2000)
     offset: int = Field(default=0, ge=0)
     where: str | None = None
+    q: str | None = None
     sort: Literal["num", "method", "url", "status", "size", "time", "start"] | None = (
         None
     )
@@ -123,6 +225,7 @@ class ScopeOut(BaseModel):
     include: list[str]
     exclude: list[str]
     drop: bool
+    version: int
 
 
 class ScopeIn(BaseModel):
@@ -160,64 +263,88 @@ class ReplayOpenRequestIn(BaseModel):
     body_b64: str | None = None
 
 
-def _event_to_json(event: SseEvent) -> str:
-    payload = {"type": event.event_type, "data": dataclasses.asdict(event.data)}
-    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+_FLOW_SUMMARY_FIELDS = tuple(f.name for f in dataclasses.fields(FlowSummary))
 
 
-def _prune_replay(now: float) -> None:
-    expired: list[str] = []
-    for key, (ts, _, _, _, _) in _replay_requests.items():
-        if now - ts > _REPLAY_TTL_S:
-            expired.append(key)
+def _event_to_frame(event: SseEvent) -> bytes:
+    # dataclasses.asdict deep-copies every field; a flat getattr walk over the
+    # precomputed field tuple is all a FlowSummary needs.
+    data = {name: getattr(event.data, name) for name in _FLOW_SUMMARY_FIELDS}
+    payload = {"type": event.event_type, "data": data}
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
 
-    for key in expired:
-        _replay_requests.pop(key, None)
+def _prune_replay(now: float) -> None:
+    while _replay_ts:
+        ts = next(iter(_replay_ts.values()))
+        if now - ts <= _REPLAY_TTL_S:
+            break
+        token, _ = _replay_ts.popitem(last=False)
+        _replay_data.pop(token, None)
+
+
+async def _prune_replay_loop() -> None:
+    while True:
+        await asyncio.sleep(_REPLAY_PRUNE_INTERVAL_S)
+        async with _replay_lock:
+            _prune_replay(time.time())
+
+
+def _get_replay_entry(token: str) -> ReplayEntry | None:
+    # Lock-free read path: dict gets are atomic under the GIL and the prune
+    # loop owns expiry, so readers only need the freshness check below for
+    # entries the loop has not reached yet.
+    ts = _replay_ts.get(token)
+    if ts is None or time.time() - ts > _REPLAY_TTL_S:
+        return None
+    return _replay_data.get(token)
+
+
+def _resp_is_textish(resp_headers: list[tuple[str, str]]) -> bool:
+    for key, value in resp_headers:
+        if key.lower() == "content-type":
+            bare = value.lower().partition(";")[0].rstrip()
+            return bare.startswith(_TEXTISH_CT_PREFIXES) or bare.endswith(
+                _TEXTISH_CT_SUFFIXES
+            )
+    # No content type: decode, matching the old unconditional behavior.
+    return True
 
 
 def _filter_upstream_headers(headers: list[tuple[str, str]]) -> list[tuple[str, str]]:
-    out: list[tuple[str, str]] = []
-    for key, value in headers:
-        if key.lower() in _HOP_BY_HOP_HEADERS:
-            continue
-        out.append((key, value))
-    return out
+    return [
+        (key, value) for key, value in headers if key.lower() not in _HOP_BY_HOP_HEADERS
+    ]
 
 
-def _make_browser_url(url: str, token: str) -> str:
-    parts = urlsplit(url)
-    query = parse_qsl(parts.query, keep_blank_values=True)
-    query.append((_REPLAY_PARAM, token))
-    new_query = urlencode(query)
+def _make_browser_url(parts: SplitResult, token: str) -> str:
+    if not parts.query:
+        # Common case: nothing to merge, and the token is token_urlsafe
+        # output so it needs no quoting.
+        new_query = f"{_REPLAY_PARAM}={token}"
+    else:
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        query.append((_REPLAY_PARAM, token))
+        new_query = urlencode(query)
     return urlunsplit(
         (parts.scheme, parts.netloc, parts.path, new_query, parts.fragment)
     )
 
 
-def _charset_from_content_type(content_type: str | None) -> str:
-    if content_type is None:
-        return "utf-8"
-
-    match = _CHARSET_RE.search(content_type)
-    if match is None:
-        return "utf-8"
-
-    charset = match.group(1).strip().strip('"').strip("'")
-    return charset or "utf-8"
-
-
-def _inject_base_href(html: str, base_href: str) -> str:
-    if "<base" in html.lower():
+def _inject_base_href(html: bytes, base_href: str) -> bytes:
+    # Splice directly into the raw bytes: one pass, no charset decode/encode
+    # round trip. Works for any ASCII-compatible encoding.
+    if html[:2] in _UTF16_BOMS or b"<base" in html.lower():
         return html
 
-    tag = f'<base href="{base_href}">'
+    tag = f'<base href="{base_href}">'.encode()
 
-    m = re.search(r"<head[^>]*>", html, flags=re.IGNORECASE)
+    m = _HEAD_OPEN_RE.search(html)
     if m:
         idx = m.end()
         return html[:idx] + tag + html[idx:]
 
-    m = re.search(r"</head>", html, flags=re.IGNORECASE)
+    m = _HEAD_CLOSE_RE.search(html)
     if m:
         idx = m.start()
         return html[:idx] + tag + html[idx:]
@@ -225,8 +352,7 @@ def _inject_base_href(html: str, base_href: str) -> str:
     return tag + html
 
 
-def _base_href_for_url(url: str) -> str:
-    parts = urlsplit(url)
+def _base_href_for_url(parts: SplitResult) -> str:
     path = parts.path or "/"
     if not path.endswith("/"):
         path = path.rsplit("/", 1)[0] + "/"
@@ -236,60 +362,81 @@ def _base_href_for_url(url: str) -> str:
 def _filtered_raw_headers(
     response: httpx.Response, *, request_url: str
 ) -> list[tuple[str, str]]:
-    out: list[tuple[str, str]] = []
-    for key_raw, value_raw in response.headers.raw:
-        key = key_raw.decode("utf-8", "replace")
-        value = value_raw.decode("utf-8", "replace")
-        key_lower = key.lower()
-
-        if key_lower in _HOP_BY_HOP_HEADERS:
-            continue
-
-        if key_lower == "location":
-            out.append((key, urljoin(request_url, value)))
-            continue
-
-        out.append((key, value))
-    return out
+    return [
+        (
+            key_raw.decode("utf-8", "replace"),
+            urljoin(request_url, value_raw.decode("utf-8", "replace"))
+            if key_lower == b"location"
+            else value_raw.decode("utf-8", "replace"),
+        )
+        for key_raw, value_raw in response.headers.raw
+        if (key_lower := key_raw.lower()) not in _HOP_BY_HOP_BYTES
+    ]
 
 
 async def publish(event: SseEvent) -> None:
-    payload = _event_to_json(event)
-    async with _sub_lock:
-        for q in list(_subscribers):
-            try:
-                q.put_nowait(payload)
-            except asyncio.QueueFull:
-                continue
+    frame = _event_to_frame(event)
+    for sub in _subscribers:
+        # A full ring drops its oldest frame automatically (deque maxlen), so
+        # slow consumers lose history instead of stalling the publisher.
+        sub.frames.append(frame)
+        sub.wakeup.set()
+
 
+async def sse_stream() -> AsyncIterator[bytes]:
+    global _subscribers  # noqa: PLW0603
 
-async def sse_stream() -> AsyncIterator[str]:
-    q: asyncio.Queue[str] = asyncio.Queue(maxsize=500)
+    sub = _SseSubscriber()
 
     async with _sub_lock:
-        _subscribers.add(q)
+        _subscribers = (*_subscribers, sub)
 
     try:
-        yield "retry: 1000\n\n"
+        yield b"retry: 1000\n\n"
+        frames = sub.frames
+        wakeup = sub.wakeup
         while True:
             try:
-                payload = await asyncio.wait_for(q.get(), timeout=15)
-                yield f"data: {payload}\n\n"
+                await asyncio.wait_for(wakeup.wait(), timeout=15)
             except TimeoutError:
-                yield ": keepalive\n\n"
+                yield b": keepalive\n\n"
+                continue
+
+            wakeup.clear()
+            while frames:
+                yield frames.popleft()
     finally:
         async with _sub_lock:
-            _subscribers.discard(q)
+            _subscribers = tuple(x for x in _subscribers if x is not sub)
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    global _http_client, _index_html  # noqa: PLW0603
+
+    if INDEX_HTML.exists():
+        _index_html = INDEX_HTML.read_bytes()
+
     await store.open()
+    _http_client = httpx.AsyncClient(
+        follow_redirects=False,
+        timeout=20.0,
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=64, max_connections=256),
+    )
+    prune_task = asyncio.create_task(_prune_replay_loop())
     yield
+    prune_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await prune_task
+    await _http_client.aclose()
+    _http_client = None
     await store.close()
 
 
-app = FastAPI(title="noshitproxy", lifespan=lifespan)
+app = FastAPI(
+    title="noshitproxy", lifespan=lifespan, default_response_class=ORJSONResponse
+)
 
 if FRONTEND_DIR.exists():
     app.mount("/static", StaticFiles(directory=str(FRONTEND_DIR)), name="static")
@@ -297,9 +444,9 @@ if FRONTEND_DIR.exists():
 
 @app.get("/", response_class=HTMLResponse)
 async def index() -> HTMLResponse:
-    if not INDEX_HTML.exists():
+    if _index_html is None:
         return HTMLResponse("<h1>index.html not found</h1>", status_code=500)
-    return HTMLResponse(INDEX_HTML.read_text(encoding="utf-8"))
+    return HTMLResponse(_index_html)
 
 
 @app.get("/api/events")
@@ -307,8 +454,7 @@ async def events() -> StreamingResponse:
     return StreamingResponse(sse_stream(), media_type="text/event-stream")
 
 
-@app.post("/api/ingest")
-async def ingest(payload: IngestRequest) -> dict[str, bool]:
+async def _ingest_one(payload: IngestRequest) -> None:
     if payload.type != "flow":
         raise HTTPException(status_code=400, detail="unknown payload type")
 
@@ -332,23 +478,30 @@ async def ingest(payload: IngestRequest) -> dict[str, bool]:
     )
 
     resp_body_text: str | None = None
-    if data.resp_body_b64:
+    if data.resp_body_b64 and _resp_is_textish(data.resp_headers):
         try:
-            decoded = base64.b64decode(data.resp_body_b64)
+            decoded = pybase64.b64decode(data.resp_body_b64, validate=False)
         except (ValueError, binascii.Error):
             decoded = b""
 
         if decoded:
             resp_body_text = decoded.decode("utf-8", "replace")
 
-    seq = await store.upsert_flow(
-        flow,
-        resp_body_b64=data.resp_body_b64,
-        resp_body_text=resp_body_text,
-    )
+    async with asyncio.TaskGroup() as tg:
+        upsert = tg.create_task(
+            store.upsert_flow(
+                flow,
+                resp_body_b64=data.resp_body_b64,
+                resp_body_text=resp_body_text,
+            )
+        )
+        # Yield once so the write reaches the DB thread, then do the
+        # timestamp formatting while the commit is in flight.
+        await asyncio.sleep(0)
+        start_at = _format_start_at(flow.ts)
 
     summary = FlowSummary(
-        seq=seq,
+        seq=upsert.result(),
         id=flow.id,
         ts=flow.ts,
         method=flow.method,
@@ -359,17 +512,31 @@ async def ingest(payload: IngestRequest) -> dict[str, bool]:
         duration=flow.duration,
         req_size=flow.req_size,
         resp_size=flow.resp_size,
-        start_at=_format_start_at(flow.ts),
+        start_at=start_at,
     )
-
     await publish(SseEvent(event_type="flow", data=summary))
+
+
+@app.post("/api/ingest")
+async def ingest(payload: IngestRequest) -> dict[str, bool]:
+    await _ingest_one(payload)
+    return {"ok": True}
+
+
+@app.post("/api/ingest_batch")
+async def ingest_batch(payloads: list[IngestRequest]) -> dict[str, bool]:
+    # One POST per capture burst instead of one per flow. Each upsert blocks
+    # on its own commit future, so the payloads have to be enqueued
+    # concurrently - that is what lets the store's write loop pick the whole
+    # burst up as a single transaction.
+    await asyncio.gather(*(_ingest_one(payload) for payload in payloads))
     return {"ok": True}
 
 
 @app.get("/api/flows/count")
 async def count_flows(query: Annotated[FlowListQuery, Depends()]) -> dict[str, int]:
     try:
-        return {"count": await store.count_flows(where=query.where)}
+        return {"count": await store.count_flows(where=query.where, q=query.q)}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
 
@@ -382,6 +549,7 @@ async def list_flows(
         limit=query.limit,
         offset=query.offset,
         where=query.where,
+        q=query.q,
         sort=query.sort,
         order=query.order,
     )
@@ -407,19 +575,44 @@ async def get_flow(flow_id: str) -> FlowCompact:
 
 
 @app.get("/api/scope")
-async def get_scope() -> ScopeOut:
+async def get_scope(wait: float = 0, version: int = -1) -> ScopeOut:
+    # wait > 0 long-polls: the request parks until the scope changes or the
+    # window lapses, so pollers stop paying one round trip per second. A
+    # poller whose echoed version is already stale is answered immediately.
+    if wait > 0 and version == _scope_version:
+        with suppress(TimeoutError):
+            await asyncio.wait_for(
+                _scope_changed.wait(), timeout=min(wait, _SCOPE_WAIT_MAX_S)
+            )
+
+    current = _scope_version
     include, exclude, drop = await store.get_scope()
-    return ScopeOut(include=include, exclude=exclude, drop=drop)
+    return ScopeOut(include=include, exclude=exclude, drop=drop, version=current)
 
 
 @app.put("/api/scope")
 async def set_scope(payload: ScopeIn) -> ScopeOut:
+    global _scope_changed, _scope_version  # noqa: PLW0603 - wake long-pollers
+
     include = [p.strip() for p in payload.include if p.strip()] or ["*"]
     exclude = [p.strip() for p in payload.exclude if p.strip()]
 
     await store.set_scope(include=include, exclude=exclude, drop=payload.drop)
+
+    # Bump the version, then wake every parked long-poller and arm a fresh
+    # event for the next generation of waiters.
+    _scope_version += 1
+    changed = _scope_changed
+    _scope_changed = asyncio.Event()
+    changed.set()
+
     saved_include, saved_exclude, saved_drop = await store.get_scope()
-    return ScopeOut(include=saved_include, exclude=saved_exclude, drop=saved_drop)
+    return ScopeOut(
+        include=saved_include,
+        exclude=saved_exclude,
+        drop=saved_drop,
+        version=_scope_version,
+    )
 
 
 @app.post("/api/flows/match")
@@ -452,6 +645,7 @@ async def repeat(payload: RepeatRequestIn) -> RepeatResponse:
 
     try:
         return await repeat_request(
+            _upstream_client(),
             method=payload.method.strip(),
             url=url,
             headers_text=payload.headers,
@@ -465,7 +659,9 @@ async def repeat(payload: RepeatRequestIn) -> RepeatResponse:
 @app.post("/api/replay/open")
 async def replay_open(payload: ReplayOpenRequestIn) -> dict[str, str]:
     url = payload.url.strip()
-    if not url.startswith(("http://", "https://")):
+    # Parse once; the SplitResult is reused for validation and browser_url.
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
         raise HTTPException(
             status_code=400, detail="url must start with http:// or https://"
         )
@@ -477,79 +673,78 @@ async def replay_open(payload: ReplayOpenRequestIn) -> dict[str, str]:
     headers = _filter_upstream_headers(payload.headers)
     if payload.body_b64:
         try:
-            body = base64.b64decode(payload.body_b64)
+            body = pybase64.b64decode(payload.body_b64, validate=False)
         except (ValueError, binascii.Error) as e:
             raise HTTPException(status_code=400, detail="invalid body_b64") from e
     else:
         body = payload.body.encode("utf-8", "replace")
 
     async with _replay_lock:
-        _prune_replay(now)
-        _replay_requests[token] = (now, method, url, headers, body)
+        _replay_ts[token] = now
+        _replay_data[token] = ReplayEntry(
+            method=method, url=url, headers=headers, body=body
+        )
 
     out = {"url": f"/replay/{token}"}
     if method == "GET" and body == b"":
-        out["browser_url"] = _make_browser_url(url, token)
+        out["browser_url"] = _make_browser_url(parts, token)
 
     return out
 
 
 @app.get("/api/replay/{token}")
 async def replay_get_spec(token: str) -> dict[str, object]:
-    async with _replay_lock:
-        now = time.time()
-        _prune_replay(now)
-        item = _replay_requests.get(token)
-
-    if item is None:
+    entry = _get_replay_entry(token)
+    if entry is None:
         raise HTTPException(status_code=404, detail="not found")
 
-    _, method, url, headers, body = item
     return {
-        "method": method,
-        "url": url,
-        "headers": headers,
-        "body": body.decode("utf-8", "replace"),
+        "method": entry.method,
+        "url": entry.url,
+        "headers": entry.headers,
+        "body": entry.body.decode("utf-8", "replace"),
     }
 
 
 @app.get("/replay/{token}")
 async def replay_get(token: str) -> Response:
-    async with _replay_lock:
-        now = time.time()
-        _prune_replay(now)
-        item = _replay_requests.get(token)
-
-    if item is None:
+    entry = _get_replay_entry(token)
+    if entry is None:
         raise HTTPException(status_code=404, detail="not found")
 
-    _, method, url, headers, body = item
+    url = entry.url
 
-    async with httpx.AsyncClient(follow_redirects=False, timeout=20.0) as client:
-        upstream = await client.request(
-            method=method,
-            url=url,
-            headers=headers,
-            content=body,
-        )
-
-    content = upstream.content
+    client = _upstream_client()
+    req = client.build_request(
+        method=entry.method, url=url, headers=entry.headers, content=entry.body
+    )
+    upstream = await client.send(req, stream=True)
 
-    content_type = upstream.headers.get("content-type")
-    if content_type is not None and "text/html" in content_type.lower():
-        charset = _charset_from_content_type(content_type)
+    # Only HTML needs the buffered injection path; check the raw header bytes
+    # so the common passthrough branch decodes and lowercases nothing.
+    ct_raw = next(
+        (v for k, v in upstream.headers.raw if k.lower() == b"content-type"), None
+    )
+    if ct_raw is not None and ct_raw.lower().startswith(b"text/html"):
+        # HTML needs base-href injection, so it has to be buffered.
         try:
-            text = content.decode(charset, "replace")
-        except LookupError:
-            text = content.decode("utf-8", "replace")
+            content = await upstream.aread()
+        finally:
+            await upstream.aclose()
 
-        injected = _inject_base_href(text, _base_href_for_url(url))
-        content = injected.encode(charset, "replace")
-
-    response = Response(
-        content=content,
-        status_code=upstream.status_code,
-    )
+        response: Response = Response(
+            content=_inject_base_href(content, _base_href_for_url(urlsplit(url))),
+            status_code=upstream.status_code,
+        )
+    else:
+        # Everything else is passed through without buffering the body.
+        # aiter_bytes yields decoded content, matching the header filter
+        # below which strips Content-Encoding/Content-Length.
+        response = StreamingResponse(
+            upstream.aiter_bytes(),
+            status_code=upstream.status_code,
+            background=BackgroundTask(upstream.aclose),
+        )
 
     for key, value in _filtered_raw_headers(upstream, request_url=url):
         response.headers.append(key, value)
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
 import base64
-from collections.abc import Iterable
-
-import httpx
+from typing import TYPE_CHECKING
 
 from noshitproxy.models import RepeatResponse
 
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    import httpx
+
 DROP_REQUEST_HEADERS = {
     "connection",
     "proxy-connection",
@@ -18,6 +21,10 @@ DROP_REQUEST_HEADERS = {
     "content-length",
 }
 
+# Lengths of the dropped header names: keys of any other length can skip the
+# .lower() allocation entirely (covers the common Accept*/Cookie headers).
+_DROP_HEADER_LENGTHS = frozenset(len(h) for h in DROP_REQUEST_HEADERS)
+
 
 def parse_headers_text(headers_text: str) -> list[tuple[str, str]]:
     out: list[tuple[str, str]] = []
@@ -27,7 +34,7 @@ def parse_headers_text(headers_text: str) -> list[tuple[str, str]]:
             continue
         key, value = line.split(":", 1)
         key = key.strip()
-        if key.lower() in DROP_REQUEST_HEADERS:
+        if len(key) in _DROP_HEADER_LENGTHS and key.lower() in DROP_REQUEST_HEADERS:
             continue
         out.append((key, value.strip()))
     return out
@@ -45,7 +52,9 @@ def _b64_prefix(data: bytes, limit: int) -> str:
     return base64.b64encode(data[:limit]).decode("ascii")
 
 
-async def repeat_request(
+async def repeat_request(  # noqa: PLR0913 - the request fields are independent knobs
+    client: httpx.AsyncClient,
+    *,
     method: str,
     url: str,
     headers_text: str,
@@ -55,13 +64,13 @@ async def repeat_request(
     headers = parse_headers_text(headers_text)
     content = body_text.encode("utf-8", "replace")
 
-    async with httpx.AsyncClient(follow_redirects=False, timeout=timeout_s) as client:
-        response = await client.request(
-            method=method.upper(),
-            url=url,
-            headers=headers,
-            content=content,
-        )
+    response = await client.request(
+        method=method.upper(),
+        url=url,
+        headers=headers,
+        content=content,
+        timeout=timeout_s,
+    )
 
     raw = response.content or b""
 
@@ -1,13 +1,34 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import functools
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
 from dataclasses import dataclass
 from datetime import UTC, datetime
 
 import aiosqlite
+import msgpack
+import orjson
 
 from noshitproxy.models import FlowCompact, FlowQuery, FlowSummary
 
+# Upper bound on how many queued upserts one transaction may coalesce.
+_MAX_WRITE_BATCH = 500
+
+# Under WAL, readers never block the writer (and vice versa), so a small pool
+# of read-only connections lets queries run while ingest is committing.
+_READER_POOL_SIZE = 4
+
+# Bound on remembered-valid where strings; saved filters stay cached while a
+# flood of one-off clauses cannot grow the set without limit.
+_WHERE_OK_MAX = 256
+
+# Pruning waits until max_rows is exceeded by this much, then trims back down
+# in one DELETE - one delete per ~_PRUNE_SLACK writes instead of one per write
+# once the table is full, at the cost of a bounded overshoot.
+_PRUNE_SLACK = 1024
+
 
 @dataclass(frozen=True, slots=True)
 class StoreConfig:
@@ -15,10 +36,22 @@ class StoreConfig:
     max_rows: int = 50_000
 
 
+@dataclass(slots=True)
+class _PendingUpsert:
+    flow_id: str
+    params: tuple[object, ...]
+    body_params: tuple[object, ...]
+    future: asyncio.Future[int]
+
+
 class StoreNotOpenError(RuntimeError):
     pass
 
 
+class StoreAlreadyOpenError(RuntimeError):
+    pass
+
+
 class InvalidWhereError(ValueError):
     pass
 
@@ -26,29 +59,119 @@ class InvalidWhereError(ValueError):
 class Store:
     def __init__(self, cfg: StoreConfig) -> None:
         self._cfg = cfg
-        self._db: aiosqlite.Connection | None = None
+        self._writer: aiosqlite.Connection | None = None
+        self._readers: list[aiosqlite.Connection] = []
+        self._reader_sem = asyncio.Semaphore(_READER_POOL_SIZE)
+        # The writer connection is shared between the write loop's explicit
+        # BEGIN IMMEDIATE..COMMIT window and the endpoint paths (set_scope,
+        # clear_flows, match_flow_ids). Every aiosqlite call is an await
+        # point, so writer-side statements take this lock to keep them from
+        # interleaving into each other's transactions.
+        self._writer_lock = asyncio.Lock()
+        self._pending: asyncio.Queue[_PendingUpsert] = asyncio.Queue()
+        self._write_task: asyncio.Task[None] | None = None
+        # Row count and high-water rowid are mirrored in memory so the write
+        # path never needs a COUNT(*) to decide whether to prune.
+        self._row_count = 0
+        self._max_seq = 0
+        # where strings that already passed validation; the schema is fixed
+        # for the life of the store, so a clause never goes stale.
+        self._where_ok: set[str] = set()
 
     async def open(self) -> None:
-        self._db = await aiosqlite.connect(self._cfg.db_path)
-        await self._db.execute("PRAGMA journal_mode=WAL;")
-        await self._db.execute("PRAGMA synchronous=NORMAL;")
-        await self._db.execute("PRAGMA temp_store=MEMORY;")
-        await self._db.execute("PRAGMA foreign_keys=ON;")
+        # The store owns exactly one long-lived connection; aiosqlite
+        # serializes all work on it, so opening twice would silently fork
+        # state (row counters, writer task) rather than add concurrency.
+        if self._writer is not None:
+            raise StoreAlreadyOpenError
+
+        # cached_statements keys on SQL string identity, so executing the
+        # module-level _SQL_* constants reuses compiled statements instead of
+        # re-parsing the text per call.
+        self._writer = await aiosqlite.connect(self._cfg.db_path, cached_statements=256)
+        await self._writer.execute("PRAGMA journal_mode=WAL;")
+        await self._writer.execute("PRAGMA synchronous=NORMAL;")
+        await self._writer.execute("PRAGMA temp_store=MEMORY;")
+        await self._writer.execute("PRAGMA foreign_keys=ON;")
+        # 64 MiB page cache and 256 MiB mmap keep repeated list/LIKE scans in
+        # memory instead of pread()ing the same pages back each query.
+        await self._writer.execute("PRAGMA cache_size=-65536;")
+        await self._writer.execute("PRAGMA mmap_size=268435456;")
+        await self._writer.execute("PRAGMA busy_timeout=5000;")
+        await self._writer.execute("PRAGMA wal_autocheckpoint=1000;")
         await self._init_schema()
+        # Scratch table for match_flow_ids; temp, so it lives and dies with
+        # the writer connection (the readers are query_only and cannot host
+        # one).
+        await self._writer.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS _match_ids(id TEXT PRIMARY KEY)"
+            " WITHOUT ROWID"
+        )
+
+        cur = await self._writer.execute(
+            "SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM flows"
+        )
+        row = await cur.fetchone()
+        await cur.close()
+        self._row_count = int(row[0]) if row is not None else 0
+        self._max_seq = int(row[1]) if row is not None else 0
+
+        for _ in range(_READER_POOL_SIZE):
+            reader = await aiosqlite.connect(self._cfg.db_path, cached_statements=256)
+            await reader.execute("PRAGMA temp_store=MEMORY;")
+            await reader.execute("PRAGMA cache_size=-65536;")
+            await reader.execute("PRAGMA mmap_size=268435456;")
+            await reader.execute("PRAGMA busy_timeout=5000;")
+            await reader.execute("PRAGMA query_only=ON;")
+            self._readers.append(reader)
+
+        self._write_task = asyncio.create_task(self._write_loop())
 
     async def close(self) -> None:
-        if self._db is None:
+        if self._writer is None:
             return
-        await self._db.close()
-        self._db = None
+        if self._write_task is not None:
+            self._write_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._write_task
+            self._write_task = None
+
+        # Flush whatever the writer did not get to.
+        leftover: list[_PendingUpsert] = []
+        while True:
+            try:
+                leftover.append(self._pending.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        if leftover:
+            await self._flush_upserts(leftover)
+
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
+
+        await self._writer.close()
+        self._writer = None
+
+    def _writer_conn(self) -> aiosqlite.Connection:
+        if self._writer is None:
+            raise StoreNotOpenError
+        return self._writer
 
-    def _conn(self) -> aiosqlite.Connection:
-        if self._db is None:
+    @asynccontextmanager
+    async def _borrow_reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._writer is None:
             raise StoreNotOpenError
-        return self._db
+
+        async with self._reader_sem:
+            reader = self._readers.pop()
+            try:
+                yield reader
+            finally:
+                self._readers.append(reader)
 
     async def _init_schema(self) -> None:
-        db = self._conn()
+        db = self._writer_conn()
         await db.executescript(
             """
             CREATE TABLE IF NOT EXISTS flows (
@@ -61,21 +184,33 @@ class Store:
               status INTEGER,
               duration REAL,
               start_at TEXT,
-              req_headers_json TEXT,
-              resp_headers_json TEXT,
+              req_headers_mp BLOB,
+              resp_headers_mp BLOB,
+              content_type TEXT,
               req_size INTEGER,
               resp_size INTEGER,
-              req_body_b64 TEXT,
               req_preview TEXT,
               resp_preview TEXT,
-              resp_body_b64 TEXT,
               resp_body_text TEXT
             );
 
+            CREATE TABLE IF NOT EXISTS flow_bodies (
+              id TEXT PRIMARY KEY REFERENCES flows(id) ON DELETE CASCADE,
+              req_body_b64 TEXT,
+              resp_body_b64 TEXT
+            );
+
             CREATE INDEX IF NOT EXISTS idx_flows_ts ON flows(ts DESC);
-            CREATE INDEX IF NOT EXISTS idx_flows_host ON flows(host);
             CREATE INDEX IF NOT EXISTS idx_flows_status ON flows(status);
-            CREATE INDEX IF NOT EXISTS idx_flows_method ON flows(method);
+
+            -- "recent flows for host X / method Y" resolves as an index range
+            -- scan instead of a lookup plus a temp-btree sort; the composites
+            -- replace the old single-column host/method indexes.
+            CREATE INDEX IF NOT EXISTS idx_flows_host_ts ON flows(host, ts DESC);
+            CREATE INDEX IF NOT EXISTS idx_flows_method_ts
+              ON flows(method, ts DESC);
+            DROP INDEX IF EXISTS idx_flows_host;
+            DROP INDEX IF EXISTS idx_flows_method;
 
             CREATE TABLE IF NOT EXISTS settings (
               key TEXT PRIMARY KEY,
@@ -84,15 +219,145 @@ class Store:
             """
         )
         await db.commit()
-        await _ensure_column(db, table="flows", column="resp_body_b64", ddl="TEXT")
-        await _ensure_column(db, table="flows", column="resp_body_text", ddl="TEXT")
-        await _ensure_column(db, table="flows", column="start_at", ddl="TEXT")
+        # One table_info scan covers every migration check below.
+        cur = await db.execute("PRAGMA table_info(flows)")
+        rows = await cur.fetchall()
+        await cur.close()
+        existing = {row[1] for row in rows}
+        for column, ddl in (
+            ("resp_body_text", "TEXT"),
+            ("start_at", "TEXT"),
+            ("content_type", "TEXT"),
+            ("req_headers_mp", "BLOB"),
+            ("resp_headers_mp", "BLOB"),
+        ):
+            await _ensure_column(db, existing, table="flows", column=column, ddl=ddl)
+        await self._migrate_headers(db, existing)
+        await self._migrate_bodies(db, existing)
+        await self._init_fts(db)
         await _ensure_setting(
             db,
             key="scope",
-            value=json.dumps({"include": ["*"], "exclude": [], "drop": False}),
+            value=orjson.dumps({"include": ["*"], "exclude": [], "drop": False}),
         )
 
+    async def _migrate_headers(
+        self, db: aiosqlite.Connection, existing: set[str]
+    ) -> None:
+        # One-shot re-encode for databases that still carry the JSON header
+        # columns; without it every pre-upgrade flow would render with empty
+        # headers and lose its content type. Newer schemas never had them.
+        if "req_headers_json" not in existing and "resp_headers_json" not in existing:
+            return
+
+        req_sql = "req_headers_json" if "req_headers_json" in existing else "NULL"
+        resp_sql = "resp_headers_json" if "resp_headers_json" in existing else "NULL"
+        cur = await db.execute(
+            f"SELECT id, {req_sql}, {resp_sql} FROM flows"  # noqa: S608
+            " WHERE req_headers_mp IS NULL AND resp_headers_mp IS NULL"
+        )
+        rows = await cur.fetchall()
+        await cur.close()
+
+        updates: list[tuple[object, ...]] = []
+        for flow_id, req_json, resp_json in rows:
+            resp_headers = _decode_headers_json(resp_json)
+            updates.append(
+                (
+                    msgpack.packb(_decode_headers_json(req_json), use_bin_type=True),
+                    msgpack.packb(resp_headers, use_bin_type=True),
+                    _header_value(resp_headers, "content-type"),
+                    flow_id,
+                )
+            )
+        if updates:
+            await db.executemany(
+                "UPDATE flows SET req_headers_mp = ?, resp_headers_mp = ?,"
+                " content_type = ? WHERE id = ?",
+                updates,
+            )
+        for column in ("req_headers_json", "resp_headers_json"):
+            if column in existing:
+                await db.execute(f"ALTER TABLE flows DROP COLUMN {column}")
+        await db.commit()
+
+    async def _migrate_bodies(
+        self, db: aiosqlite.Connection, existing: set[str]
+    ) -> None:
+        # One-shot move for databases that still store bodies inline in
+        # flows; newer schemas never had the columns.
+        if "req_body_b64" not in existing and "resp_body_b64" not in existing:
+            return
+
+        req_sql = "req_body_b64" if "req_body_b64" in existing else "NULL"
+        resp_sql = "resp_body_b64" if "resp_body_b64" in existing else "NULL"
+        await db.execute(
+            "INSERT OR IGNORE INTO flow_bodies(id, req_body_b64, resp_body_b64) "  # noqa: S608
+            f"SELECT id, {req_sql}, {resp_sql} FROM flows"
+        )
+        for column in ("req_body_b64", "resp_body_b64"):
+            if column in existing:
+                await db.execute(f"ALTER TABLE flows DROP COLUMN {column}")
+        await db.commit()
+
+    async def _init_fts(self, db: aiosqlite.Connection) -> None:
+        # Trigram-tokenized FTS5 over the searchable text columns gives the
+        # q filter substring semantics without LIKE '%..%' full-table scans.
+        cur = await db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='flows_fts'"
+        )
+        existed = await cur.fetchone() is not None
+        await cur.close()
+
+        await db.executescript(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS flows_fts USING fts5(
+              url, req_preview, resp_preview, resp_body_text,
+              content='flows', content_rowid='rowid', tokenize='trigram'
+            );
+
+            CREATE TRIGGER IF NOT EXISTS flows_fts_ai AFTER INSERT ON flows
+            BEGIN
+              INSERT INTO flows_fts(
+                rowid, url, req_preview, resp_preview, resp_body_text
+              ) VALUES (
+                new.rowid, new.url, new.req_preview, new.resp_preview,
+                new.resp_body_text
+              );
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS flows_fts_ad AFTER DELETE ON flows
+            BEGIN
+              INSERT INTO flows_fts(
+                flows_fts, rowid, url, req_preview, resp_preview, resp_body_text
+              ) VALUES (
+                'delete', old.rowid, old.url, old.req_preview, old.resp_preview,
+                old.resp_body_text
+              );
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS flows_fts_au AFTER UPDATE ON flows
+            BEGIN
+              INSERT INTO flows_fts(
+                flows_fts, rowid, url, req_preview, resp_preview, resp_body_text
+              ) VALUES (
+                'delete', old.rowid, old.url, old.req_preview, old.resp_preview,
+                old.resp_body_text
+              );
+              INSERT INTO flows_fts(
+                rowid, url, req_preview, resp_preview, resp_body_text
+              ) VALUES (
+                new.rowid, new.url, new.req_preview, new.resp_preview,
+                new.resp_body_text
+              );
+            END;
+            """
+        )
+        if not existed:
+            # Fresh index over a pre-existing database: backfill once.
+            await db.execute("INSERT INTO flows_fts(flows_fts) VALUES('rebuild')")
+        await db.commit()
+
     async def upsert_flow(
         self,
         flow: FlowCompact,
@@ -100,162 +365,207 @@ class Store:
         resp_body_b64: str | None,
         resp_body_text: str | None,
     ) -> int:
-        db = self._conn()
-        await db.execute(
-            """
-             INSERT INTO flows (
-              id, ts, method, url, host, path, status, duration,
-              start_at,
-              req_headers_json, resp_headers_json,
-              req_size, resp_size, req_body_b64,
-              req_preview, resp_preview,
-              resp_body_b64, resp_body_text
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(id) DO UPDATE SET
-              ts=excluded.ts,
-              method=excluded.method,
-              url=excluded.url,
-              host=excluded.host,
-              path=excluded.path,
-              status=excluded.status,
-              duration=excluded.duration,
-              start_at=excluded.start_at,
-              req_headers_json=excluded.req_headers_json,
-              resp_headers_json=excluded.resp_headers_json,
-              req_size=excluded.req_size,
-              resp_size=excluded.resp_size,
-              req_body_b64=excluded.req_body_b64,
-              req_preview=excluded.req_preview,
-              resp_preview=excluded.resp_preview,
-              resp_body_b64=excluded.resp_body_b64,
-              resp_body_text=excluded.resp_body_text
-            """,
-            (
-                flow.id,
-                float(flow.ts),
-                flow.method or "GET",
-                flow.url,
-                flow.host,
-                flow.path,
-                flow.status,
-                flow.duration,
-                _format_start_at(flow.ts),
-                json.dumps(flow.req_headers, ensure_ascii=False),
-                json.dumps(flow.resp_headers, ensure_ascii=False),
-                int(flow.req_size),
-                int(flow.resp_size),
-                flow.req_body_b64,
-                flow.req_preview,
-                flow.resp_preview,
-                resp_body_b64,
-                resp_body_text,
-            ),
+        # Writes are funneled through a single background writer that groups
+        # queued upserts into one transaction, so concurrent ingest pays for
+        # one COMMIT (one fsync) per batch instead of per flow. Refuse up
+        # front when the store is closed - an enqueued item would otherwise
+        # await a future nobody will ever resolve.
+        if self._writer is None:
+            raise StoreNotOpenError
+
+        params = (
+            flow.id,
+            float(flow.ts),
+            flow.method or "GET",
+            flow.url,
+            flow.host,
+            flow.path,
+            flow.status,
+            flow.duration,
+            _format_start_at(flow.ts),
+            # MessagePack blobs are ~half the size of the old JSON text and
+            # decode straight back into pairs without per-item validation.
+            msgpack.packb(flow.req_headers, use_bin_type=True),
+            msgpack.packb(flow.resp_headers, use_bin_type=True),
+            # Projected once at write time so body fetches never re-parse the
+            # full header blob just to find the content type.
+            _header_value(flow.resp_headers, "content-type"),
+            int(flow.req_size),
+            int(flow.resp_size),
+            flow.req_preview,
+            flow.resp_preview,
+            resp_body_text,
         )
-        await db.commit()
+        body_params = (flow.id, flow.req_body_b64, resp_body_b64)
+        future: asyncio.Future[int] = asyncio.get_running_loop().create_future()
+        self._pending.put_nowait(
+            _PendingUpsert(
+                flow_id=flow.id,
+                params=params,
+                body_params=body_params,
+                future=future,
+            )
+        )
+        return await future
+
+    async def _write_loop(self) -> None:
+        while True:
+            batch = [await self._pending.get()]
+            while len(batch) < _MAX_WRITE_BATCH:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            await self._flush_upserts(batch)
+
+    async def _flush_upserts(self, batch: list[_PendingUpsert]) -> None:
+        db = self._writer_conn()
+        seqs: list[int] = []
+        try:
+            async with self._writer_lock:
+                await db.execute("BEGIN IMMEDIATE")
+                for item in batch:
+                    cur = await db.execute(_SQL_UPSERT, item.params)
+                    row = await cur.fetchone()
+                    await cur.close()
+                    seqs.append(int(row[0]) if row is not None else 0)
+                    await db.execute(_SQL_UPSERT_BODY, item.body_params)
+                await db.commit()
+        except Exception as e:  # noqa: BLE001 - relayed to the awaiting callers
+            with suppress(Exception):
+                await db.rollback()
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
 
-        cur = await db.execute("SELECT rowid FROM flows WHERE id = ?", (flow.id,))
-        row = await cur.fetchone()
-        await cur.close()
-        seq = int(row[0]) if row is not None else 0
+        for item, seq in zip(batch, seqs, strict=True):
+            # A seq above the high-water mark means a genuine insert rather
+            # than an ON CONFLICT update (pruning only removes old rows, so
+            # the max rowid survives; clear_flows resets both counters).
+            if seq > self._max_seq:
+                self._max_seq = seq
+                self._row_count += 1
+            if not item.future.done():
+                item.future.set_result(seq)
 
         await self._prune_if_needed()
-        return seq
 
     async def _prune_if_needed(self) -> None:
-        db = self._conn()
-
-        cur = await db.execute("SELECT COUNT(*) FROM flows")
-        row = await cur.fetchone()
-        await cur.close()
+        if self._row_count <= self._cfg.max_rows + _PRUNE_SLACK:
+            return
 
-        total = int(row[0]) if row is not None else 0
-        if total <= self._cfg.max_rows:
+        db = self._writer_conn()
+        to_delete = self._row_count - self._cfg.max_rows
+        async with self._writer_lock:
+            # By now the batch is committed and its futures resolved, so a
+            # failed prune (SQLITE_FULL/SQLITE_BUSY - disk pressure is
+            # exactly when pruning fires) has no caller to surface to and
+            # must not escape and kill the write loop. Roll back and let the
+            # next flush retry once the slack is exceeded again.
+            try:
+                cur = await db.execute(
+                    """
+                    DELETE FROM flows
+                    WHERE rowid IN (
+                      SELECT rowid FROM flows
+                      ORDER BY ts ASC
+                      LIMIT ?
+                    )
+                    """,
+                    (to_delete,),
+                )
+                await db.commit()
+            except Exception:  # noqa: BLE001 - the writer must survive
+                with suppress(Exception):
+                    await db.rollback()
+                return
+        self._row_count -= max(cur.rowcount, 0)
+
+    async def _validate_where(self, db: aiosqlite.Connection, where: str) -> None:
+        # Prevent multi-statements and ensure the expression compiles. EXPLAIN
+        # only parses and plans - it never touches row data - and a clause that
+        # compiled once is remembered so repeat queries skip the round-trip.
+        if where in self._where_ok:
             return
 
-        to_delete = total - self._cfg.max_rows
-        await db.execute(
-            """
-            DELETE FROM flows
-            WHERE id IN (
-              SELECT id FROM flows
-              ORDER BY ts ASC
-              LIMIT ?
+        if ";" in where:
+            raise InvalidWhereError(WHERE_SEMICOLON_ERROR)
+
+        try:
+            cur = await db.execute(
+                f"EXPLAIN SELECT 1 FROM flows WHERE ({where})"  # noqa: S608
             )
-            """,
-            (to_delete,),
-        )
-        await db.commit()
+            await cur.close()
+        except Exception as e:
+            raise InvalidWhereError(str(e)) from e
+
+        if len(self._where_ok) < _WHERE_OK_MAX:
+            self._where_ok.add(where)
 
-    async def count_flows(self, *, where: str | None) -> int:
-        db = self._conn()
-        if where:
-            await _validate_where(db, where)
+    async def count_flows(self, *, where: str | None, q: str | None = None) -> int:
+        filter_sql, params = _build_filters(where, q)
 
         sql = "SELECT COUNT(*) FROM flows"
-        if where:
-            sql += f" WHERE ({where})"
+        if filter_sql:
+            sql += f" WHERE {filter_sql}"
 
-        cur = await db.execute(sql)
-        row = await cur.fetchone()
-        await cur.close()
+        async with self._borrow_reader() as db:
+            if where:
+                await self._validate_where(db, where)
+
+            cur = await db.execute(sql, params)
+            row = await cur.fetchone()
+            await cur.close()
         return int(row[0]) if row is not None else 0
 
     async def list_flows(self, query: FlowQuery) -> list[FlowSummary]:
-        db = self._conn()
-
-        where: list[str] = []
-        params: list[object] = []
-
-        if query.where:
-            where.append(f"({query.where})")
-            await _validate_where(db, query.where)
-
-        sql_parts = [
-            "SELECT rowid, id, ts, method, url, host, path, status, duration,",
-            "       req_size, resp_size",
-            "FROM flows",
-        ]
-        if where:
-            sql_parts.append("WHERE " + " AND ".join(where))
-
-        sql_parts.append(_order_by_sql(query.sort, query.order))
-        sql_parts.append("LIMIT ? OFFSET ?")
-
-        params.extend([int(query.limit), int(query.offset)])
-        sql = "\n".join(sql_parts)
-
-        cur = await db.execute(sql, params)
-        rows = await cur.fetchall()
-        await cur.close()
-
-        return [
-            FlowSummary(
-                seq=int(row[0]),
-                id=row[1],
-                ts=row[2],
-                method=row[3],
-                url=row[4],
-                host=row[5],
-                path=row[6],
-                status=row[7],
-                duration=row[8],
-                req_size=row[9],
-                resp_size=row[10],
-                start_at=_format_start_at(row[2]),
-            )
-            for row in rows
-        ]
+        filter_sql, filter_params = _build_filters(query.where, query.q)
+        sql = _compile_list_sql(filter_sql, query.sort, query.order)
+        params = [*filter_params, int(query.limit), int(query.offset)]
+
+        # Build summaries while the cursor streams instead of materializing
+        # every raw row via fetchall() and walking the batch a second time.
+        async with self._borrow_reader() as db:
+            if query.where:
+                await self._validate_where(db, query.where)
+
+            cur = await db.execute(sql, params)
+            out = [
+                FlowSummary(
+                    seq=int(row[0]),
+                    id=row[1],
+                    ts=row[2],
+                    method=row[3],
+                    url=row[4],
+                    host=row[5],
+                    path=row[6],
+                    status=row[7],
+                    duration=row[8],
+                    req_size=row[9],
+                    resp_size=row[10],
+                    start_at=_format_start_at(row[2]),
+                )
+                async for row in cur
+            ]
+            await cur.close()
+
+        return out
 
     async def get_scope(self) -> tuple[list[str], list[str], bool]:
-        db = self._conn()
-        cur = await db.execute("SELECT value FROM settings WHERE key = ?", ("scope",))
-        row = await cur.fetchone()
-        await cur.close()
+        async with self._borrow_reader() as db:
+            cur = await db.execute(
+                "SELECT value FROM settings WHERE key = ?", ("scope",)
+            )
+            row = await cur.fetchone()
+            await cur.close()
 
-        if row is None or not isinstance(row[0], str) or row[0] == "":
+        # orjson accepts bytes or str, so scopes written as UTF-8 blobs and
+        # legacy TEXT rows decode through the same call.
+        if row is None or not isinstance(row[0], bytes | str) or not row[0]:
             return ["*"], [], False
 
-        loaded: object = json.loads(row[0])
+        loaded: object = orjson.loads(row[0])
         if not isinstance(loaded, dict):
             return ["*"], [], False
 
@@ -285,51 +595,60 @@ class Store:
     async def set_scope(
         self, *, include: list[str], exclude: list[str], drop: bool
     ) -> None:
-        db = self._conn()
-        payload = json.dumps(
-            {"include": include, "exclude": exclude, "drop": drop},
-            ensure_ascii=False,
-        )
-        await db.execute(
-            "INSERT INTO settings(key, value) VALUES(?, ?) "
-            "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
-            ("scope", payload),
-        )
-        await db.commit()
+        db = self._writer_conn()
+        payload = orjson.dumps({"include": include, "exclude": exclude, "drop": drop})
+        async with self._writer_lock:
+            await db.execute(
+                "INSERT INTO settings(key, value) VALUES(?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                ("scope", payload),
+            )
+            await db.commit()
 
     async def clear_flows(self) -> None:
-        db = self._conn()
-        await db.execute("DELETE FROM flows")
-        await db.commit()
+        db = self._writer_conn()
+        async with self._writer_lock:
+            await db.execute("DELETE FROM flows")
+            await db.commit()
+        self._row_count = 0
+        self._max_seq = 0
 
     async def match_flow_ids(self, *, where: str, ids: list[str]) -> list[str]:
         if not ids:
             return []
 
-        db = self._conn()
-        await _validate_where(db, where)
-
-        placeholders = ",".join("?" for _ in ids)
-        sql = f"SELECT id FROM flows WHERE id IN ({placeholders}) AND ({where})"  # noqa: S608
-
-        cur = await db.execute(sql, ids)
-        rows = await cur.fetchall()
-        await cur.close()
+        # Joining against the temp table keeps the statement text stable (so
+        # it stays prepared) and sidesteps SQLite's bind-parameter limit that
+        # a ?,?,...,? placeholder list would hit on large selections.
+        db = self._writer_conn()
+        async with self._writer_lock:
+            await self._validate_where(db, where)
+
+            await db.execute("DELETE FROM _match_ids")
+            await db.executemany(
+                "INSERT INTO _match_ids(id) VALUES (?)",
+                ((flow_id,) for flow_id in ids),
+            )
+            cur = await db.execute(
+                # USING keeps both bare id and flows.-qualified references
+                # resolving exactly as the unaliased EXPLAIN validation did.
+                "SELECT flows.id FROM flows JOIN _match_ids USING (id)"  # noqa: S608
+                f" WHERE ({where})"
+            )
+            rows = await cur.fetchall()
+            await cur.close()
+            # The temp-table writes opened an implicit transaction (legacy
+            # sqlite3 isolation); commit it so the write loop's next
+            # BEGIN IMMEDIATE does not land inside it.
+            await db.commit()
 
         return [str(row[0]) for row in rows]
 
     async def get_resp_body(self, flow_id: str) -> tuple[str, str | None, int] | None:
-        db = self._conn()
-        cur = await db.execute(
-            """
-            SELECT resp_body_b64, resp_headers_json, resp_size
-            FROM flows
-            WHERE id = ?
-            """,
-            (flow_id,),
-        )
-        row = await cur.fetchone()
-        await cur.close()
+        async with self._borrow_reader() as db:
+            cur = await db.execute(_SQL_GET_RESP_BODY, (flow_id,))
+            row = await cur.fetchone()
+            await cur.close()
         if row is None:
             return None
 
@@ -337,27 +656,16 @@ class Store:
         if not isinstance(resp_body_b64, str) or resp_body_b64 == "":
             return None
 
-        headers = _decode_headers_json(row[1])
-        content_type = _header_value(headers, "content-type")
+        content_type = row[1] if isinstance(row[1], str) else None
         size = int(row[2] or 0)
 
         return resp_body_b64, content_type, size
 
     async def get_flow(self, flow_id: str) -> FlowCompact | None:
-        db = self._conn()
-        cur = await db.execute(
-            """
-            SELECT id, ts, method, url, host, path, status, duration,
-                   req_headers_json, resp_headers_json,
-                   req_size, resp_size, req_body_b64,
-                   req_preview, resp_preview
-            FROM flows
-            WHERE id = ?
-            """,
-            (flow_id,),
-        )
-        row = await cur.fetchone()
-        await cur.close()
+        async with self._borrow_reader() as db:
+            cur = await db.execute(_SQL_GET_FLOW, (flow_id,))
+            row = await cur.fetchone()
+            await cur.close()
         if row is None:
             return None
 
@@ -370,8 +678,8 @@ class Store:
             path=row[5],
             status=row[6],
             duration=row[7],
-            req_headers=_decode_headers_json(row[8]),
-            resp_headers=_decode_headers_json(row[9]),
+            req_headers=_decode_headers_blob(row[8]),
+            resp_headers=_decode_headers_blob(row[9]),
             req_size=row[10],
             resp_size=row[11],
             req_body_b64=row[12],
@@ -380,6 +688,108 @@ class Store:
         )
 
 
+# Hot statements live at module level so every execute passes the exact same
+# string object and hits the connection's prepared-statement cache.
+_SQL_UPSERT = """
+INSERT INTO flows (
+  id, ts, method, url, host, path, status, duration,
+  start_at,
+  req_headers_mp, resp_headers_mp, content_type,
+  req_size, resp_size,
+  req_preview, resp_preview,
+  resp_body_text
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+  status=excluded.status,
+  duration=excluded.duration,
+  resp_headers_mp=excluded.resp_headers_mp,
+  content_type=excluded.content_type,
+  resp_size=excluded.resp_size,
+  resp_preview=excluded.resp_preview,
+  resp_body_text=excluded.resp_body_text
+RETURNING rowid
+"""
+
+_SQL_UPSERT_BODY = """
+INSERT INTO flow_bodies (id, req_body_b64, resp_body_b64)
+VALUES (?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+  resp_body_b64=excluded.resp_body_b64
+"""
+
+_SQL_GET_RESP_BODY = """
+SELECT b.resp_body_b64, f.content_type, f.resp_size
+FROM flows f
+LEFT JOIN flow_bodies b ON b.id = f.id
+WHERE f.id = ?
+"""
+
+_SQL_GET_FLOW = """
+SELECT f.id, f.ts, f.method, f.url, f.host, f.path, f.status, f.duration,
+       f.req_headers_mp, f.resp_headers_mp,
+       f.req_size, f.resp_size, b.req_body_b64,
+       f.req_preview, f.resp_preview
+FROM flows f
+LEFT JOIN flow_bodies b ON b.id = f.id
+WHERE f.id = ?
+"""
+
+_SELECT_FLOWS_PREFIX = (
+    "SELECT rowid, id, ts, method, url, host, path, status, duration,\n"
+    "       req_size, resp_size\n"
+    "FROM flows"
+)
+
+
+def _build_filters(where: str | None, q: str | None) -> tuple[str | None, list[object]]:
+    # Single place that turns the (where, q) pair into a WHERE expression and
+    # its bind parameters, shared by count_flows and list_flows.
+    clauses: list[str] = []
+    params: list[object] = []
+    if where:
+        clauses.append(f"({where})")
+    if q:
+        q_sql, q_params = _q_filter(q)
+        clauses.append(q_sql)
+        params.extend(q_params)
+
+    if not clauses:
+        return None, params
+    return " AND ".join(clauses), params
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_list_sql(
+    filter_sql: str | None, sort: str | None, order: str | None
+) -> str:
+    # Dashboards re-issue the same (filter, sort) shape thousands of times;
+    # memoizing the assembled text also means sqlite3's statement cache is
+    # keyed on an identical string and skips re-parsing.
+    sql = _SELECT_FLOWS_PREFIX
+    if filter_sql:
+        sql += f"\nWHERE {filter_sql}"
+    order_by = _ORDER_BY.get((sort, order), _DEFAULT_ORDER_BY)
+    return f"{sql}\n{order_by}\nLIMIT ? OFFSET ?"
+
+
+# The trigram tokenizer needs at least three characters; shorter needles fall
+# back to a LIKE scan over the same columns.
+_FTS_MIN_QUERY_LEN = 3
+_FTS_MATCH_SQL = "rowid IN (SELECT rowid FROM flows_fts WHERE flows_fts MATCH ?)"
+_LIKE_FALLBACK_SQL = (
+    "(url LIKE ? OR req_preview LIKE ? OR resp_preview LIKE ? OR resp_body_text LIKE ?)"
+)
+
+
+def _q_filter(q: str) -> tuple[str, list[object]]:
+    if len(q) >= _FTS_MIN_QUERY_LEN:
+        quoted = '"' + q.replace('"', '""') + '"'
+        return _FTS_MATCH_SQL, [quoted]
+
+    needle = f"%{q}%"
+    return _LIKE_FALLBACK_SQL, [needle, needle, needle, needle]
+
+
 def _format_start_at(ts: object) -> str:
     if not isinstance(ts, int | float):
         return "—"
@@ -413,27 +823,24 @@ def _order_by_sql(sort_key: str | None, order: str | None) -> str:
     if sort_key == "start":
         return f"ORDER BY ts {direction}"
 
-    return "ORDER BY ts DESC"
+    return _DEFAULT_ORDER_BY
 
 
-WHERE_SEMICOLON_ERROR = "Semicolons are not allowed in WHERE"
+_DEFAULT_ORDER_BY = "ORDER BY ts DESC"
 
+# Every legal (sort, order) pair pre-rendered at import time; the hot query
+# path does a single dict lookup instead of walking _order_by_sql's branches.
+_ORDER_BY: dict[tuple[str | None, str | None], str] = {
+    (sort_key, order): _order_by_sql(sort_key, order)
+    for sort_key in (None, "num", "url", "method", "size", "status", "time", "start")
+    for order in (None, "asc", "desc")
+}
 
-async def _validate_where(db: aiosqlite.Connection, where: str) -> None:
-    # Prevent multi-statements and ensure expression compiles.
-    if ";" in where:
-        raise InvalidWhereError(WHERE_SEMICOLON_ERROR)
 
-    try:
-        cur = await db.execute(
-            f"SELECT 1 FROM flows WHERE ({where}) LIMIT 1"  # noqa: S608
-        )
-        await cur.close()
-    except Exception as e:
-        raise InvalidWhereError(str(e)) from e
+WHERE_SEMICOLON_ERROR = "Semicolons are not allowed in WHERE"
 
 
-async def _ensure_setting(db: aiosqlite.Connection, *, key: str, value: str) -> None:
+async def _ensure_setting(db: aiosqlite.Connection, *, key: str, value: bytes) -> None:
     cur = await db.execute("SELECT 1 FROM settings WHERE key = ?", (key,))
     row = await cur.fetchone()
     await cur.close()
@@ -445,13 +852,13 @@ async def _ensure_setting(db: aiosqlite.Connection, *, key: str, value: str) ->
 
 
 async def _ensure_column(
-    db: aiosqlite.Connection, *, table: str, column: str, ddl: str
+    db: aiosqlite.Connection,
+    existing: set[str],
+    *,
+    table: str,
+    column: str,
+    ddl: str,
 ) -> None:
-    cur = await db.execute(f"PRAGMA table_info({table})")
-    rows = await cur.fetchall()
-    await cur.close()
-
-    existing = {row[1] for row in rows}
     if column in existing:
         return
 
@@ -460,30 +867,42 @@ async def _ensure_column(
 
 
 def _header_value(headers: list[tuple[str, str]], name: str) -> str | None:
+    # Length-gate before lowercasing (same trick as the repeater's header
+    # drop set): keys of the wrong length skip the .lower() allocation.
     needle = name.lower()
+    size = len(needle)
     for key, value in headers:
-        if key.lower() == needle:
+        if len(key) == size and key.lower() == needle:
             return value
     return None
 
 
-HEADER_PAIR_LEN = 2
-
-
-def _decode_headers_json(raw: str | None) -> list[tuple[str, str]]:
-    if raw is None or raw == "":
+def _decode_headers_json(raw: object) -> list[tuple[str, str]]:
+    # Legacy header columns came from arbitrary schema versions, so unlike
+    # the blobs below the shape is not trusted.
+    if not isinstance(raw, bytes | str) or not raw:
+        return []
+    try:
+        loaded: object = orjson.loads(raw)
+    except orjson.JSONDecodeError:
         return []
-
-    loaded: object = json.loads(raw)
     if not isinstance(loaded, list):
         return []
 
     out: list[tuple[str, str]] = []
     for item in loaded:
-        if not isinstance(item, (list, tuple)) or len(item) != HEADER_PAIR_LEN:
+        try:
+            key, value = item
+        except (TypeError, ValueError):
             continue
-        key, value = item[0], item[1]
-        if not isinstance(key, str) or not isinstance(value, str):
-            continue
-        out.append((key, value))
+        if isinstance(key, str) and isinstance(value, str):
+            out.append((key, value))
     return out
+
+
+def _decode_headers_blob(raw: bytes | None) -> list[tuple[str, str]]:
+    # Blobs are written exclusively by upsert_flow, so the shape is trusted;
+    # use_list=False yields the (key, value) tuples FlowCompact expects.
+    if not raw:
+        return []
+    return list(msgpack.unpackb(raw, raw=False, use_list=False))
@@ -44,6 +44,7 @@ class FlowQuery:
     limit: int = 200
     offset: int = 0
     where: str | None = None
+    q: str | None = None
     sort: str | None = None
     order: Literal["asc", "desc"] | None = None
 
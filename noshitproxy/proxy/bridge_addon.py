@@ -2,45 +2,122 @@ from __future__ import annotations
 
 import dataclasses
 import fnmatch
-import json
-import queue
+import functools
 import re
 import threading
 import time
-from contextlib import suppress
-from typing import TYPE_CHECKING
+from collections import deque
+from typing import TYPE_CHECKING, cast
 from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 import httpx
+import orjson
 
+from noshitproxy.models import FlowCompact
 from noshitproxy.proxy.serialize import flow_ingest
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
     from mitmproxy import http
 
-    from noshitproxy.models import FlowCompact
+    _UrlMatcher = Callable[[str], re.Match[str] | None]
 
-BACKEND_INGEST = "http://127.0.0.1:8000/api/ingest"
+BACKEND_INGEST = "http://127.0.0.1:8000/api/ingest_batch"
 BACKEND_REPLAY = "http://127.0.0.1:8000/api/replay"
 BACKEND_SCOPE = "http://127.0.0.1:8000/api/scope"
 REPLAY_PARAM = "__nsp"
 
+# How many payloads one POST may carry, and how long the worker lingers for
+# stragglers after the first one arrives.
+INGEST_BATCH_MAX = 64
+INGEST_BATCH_WINDOW_S = 0.005
+
+# How long each scope long-poll asks the backend to hold the request open.
+SCOPE_WAIT_S = 30.0
+
+# Pause between scope polls when the backend errors or answers garbage; a
+# reachable-but-broken backend returns instantly, so without this the poller
+# degenerates into a hot request loop.
+SCOPE_ERROR_BACKOFF_S = 2.0
+
 HTTP_OK = 200
-HEADER_PAIR_LEN = 2
 
 WILDCARD_CHARS = set("*?[")
 
 
-def _compile_scope_pattern(pattern: str) -> tuple[re.Pattern[str], bool]:
-    # If pattern has no wildcard syntax, treat it as substring match.
-    if not any(ch in pattern for ch in WILDCARD_CHARS):
-        return re.compile(re.escape(pattern)), True
-
-    return re.compile(fnmatch.translate(pattern)), False
+@functools.lru_cache(maxsize=64)
+def _compile_scope_matcher(patterns: tuple[str, ...]) -> _UrlMatcher | None:
+    # One alternation per pattern list turns the per-flow check into a single
+    # C-level call instead of a Python loop over N patterns; the cache makes
+    # recompiles on unchanged pattern tuples free. What comes back is the
+    # bound matcher method to drive the combined regex with.
+    if not patterns:
+        return None
+
+    is_wildcard = [any(ch in p for ch in WILDCARD_CHARS) for p in patterns]
+    if all(is_wildcard):
+        # Pure wildcard lists run under fullmatch, letting the engine bail
+        # on length/prefix mismatches without the scan-and-anchor dance.
+        alternation = "|".join(f"(?:{fnmatch.translate(p)})" for p in patterns)
+        return re.compile(alternation).fullmatch
+
+    # Mixed lists need search: plain strings keep substring semantics, and
+    # wildcard branches are re-anchored with \A so searching them still
+    # means whole-URL matching.
+    branches = [
+        rf"\A(?:{fnmatch.translate(p)})" if wild else f"(?:{re.escape(p)})"
+        for p, wild in zip(patterns, is_wildcard, strict=True)
+    ]
+    return re.compile("|".join(branches)).search
+
+
+@functools.lru_cache(maxsize=4096)
+def _in_scope_cached(
+    include: _UrlMatcher | None, exclude: _UrlMatcher | None, url: str
+) -> bool:
+    # Real traffic hammers the same URLs, so the verdict is memoized. Keying
+    # on the snapshot matchers themselves means a scope change invalidates
+    # naturally: old entries just stop being hit and age out of the LRU.
+    if include is None:
+        return True
+
+    if include(url) is None:
+        return False
+
+    return exclude is None or exclude(url) is None
+
+
+# The {"type":"flow",...} wrapper never varies, so it is spliced on as bytes
+# and orjson only ever serializes the data dict.
+_ENVELOPE_PREFIX = b'{"type":"flow","data":'
+_ENVELOPE_SUFFIX = b"}"
+
+
+def _build_payload_encoder() -> Callable[[FlowCompact, str | None], bytes]:
+    # The envelope shape is fixed by FlowCompact's schema, so the encoder is
+    # generated once at import: a dict display of plain attribute loads with
+    # the field names folded in as constants, straight into orjson. A field
+    # added to the dataclass is picked up automatically.
+    fields = ", ".join(
+        f'"{f.name}": flow.{f.name}' for f in dataclasses.fields(FlowCompact)
+    )
+    src = (
+        "def _encode(flow, resp_body_b64):\n"
+        "    return prefix + orjson.dumps({"
+        + fields
+        + ', "resp_body_b64": resp_body_b64}) + suffix\n'
+    )
+    namespace: dict[str, object] = {
+        "orjson": orjson,
+        "prefix": _ENVELOPE_PREFIX,
+        "suffix": _ENVELOPE_SUFFIX,
+    }
+    exec(src, namespace)  # noqa: S102 - source is built from our own schema
+    return cast("Callable[[FlowCompact, str | None], bytes]", namespace["_encode"])
 
 
-def _matches(regex: re.Pattern[str], *, substring: bool, url: str) -> bool:
-    return (regex.search(url) if substring else regex.match(url)) is not None
+_encode_flow_payload = _build_payload_encoder()
 
 
 class ReplaySpec:
@@ -84,17 +161,26 @@ def _strip_replay_param(url: str) -> tuple[str | None, str | None]:
 class BridgeAddon:
     def __init__(self, ingest_url: str = BACKEND_INGEST) -> None:
         self._ingest_url = ingest_url
-        self._queue: queue.Queue[str] = queue.Queue(maxsize=10_000)
+        # deque append/popleft are atomic in CPython, so the handoff between
+        # mitmproxy's threads and the worker needs no lock or condition; the
+        # Event is just a wakeup. A full ring drops the oldest payload, same
+        # policy as the backend's SSE frame ring.
+        self._queue: deque[bytes] = deque(maxlen=10_000)
+        self._queue_event = threading.Event()
         self._replay_client = httpx.Client(timeout=1.0)
 
+        # Writers serialize on the lock; the hot request path reads the
+        # snapshot tuple without locking - replacing the attribute is a
+        # single atomic store under the GIL.
         self._scope_lock = threading.Lock()
         self._scope_drop = False
         self._scope_include: list[str] = ["*"]
         self._scope_exclude: list[str] = []
-        self._scope_include_regex: list[tuple[re.Pattern[str], bool]] = [
-            _compile_scope_pattern("*")
-        ]
-        self._scope_exclude_regex: list[tuple[re.Pattern[str], bool]] = []
+        self._scope_snapshot: tuple[_UrlMatcher | None, _UrlMatcher | None, bool] = (
+            _compile_scope_matcher(("*",)),
+            None,
+            False,
+        )
 
         self._worker = threading.Thread(target=self._run, daemon=True)
         self._worker.start()
@@ -105,60 +191,92 @@ class BridgeAddon:
     def _run(self) -> None:
         with httpx.Client(timeout=2.0) as client:
             while True:
-                payload = self._queue.get()
+                # Wake on the first payload, then linger briefly to sweep
+                # up the rest of the burst - one POST instead of up to 64.
+                self._queue_event.wait()
+                self._queue_event.clear()
+                time.sleep(INGEST_BATCH_WINDOW_S)
+
+                batch: list[bytes] = []
+                while self._queue and len(batch) < INGEST_BATCH_MAX:
+                    batch.append(self._queue.popleft())
+                if not batch:
+                    continue
+                if self._queue:
+                    # Leftovers beyond the batch cap: come straight back.
+                    self._queue_event.set()
+
                 try:
                     client.post(
                         self._ingest_url,
-                        content=payload,
+                        content=b"[" + b",".join(batch) + b"]",
                         headers={"content-type": "application/json"},
                     )
                 except (httpx.HTTPError, OSError):
                     time.sleep(0.05)
 
     def _poll_scope(self) -> None:
-        with httpx.Client(timeout=2.0) as client:
+        # Long-poll: the backend parks the request until the scope actually
+        # changes (or its keepalive window lapses), so steady state is one
+        # idle connection rather than a GET plus JSON parse every second.
+        # The first fetch asks with wait=0 - until it lands the proxy runs on
+        # the built-in default scope, so the persisted one has to apply right
+        # after a restart, not a poll window later. Echoing the version lets
+        # the backend answer immediately when a change raced between polls.
+        wait = 0.0
+        version = -1
+        with httpx.Client(timeout=SCOPE_WAIT_S + 5.0) as client:
             while True:
                 try:
-                    response = client.get(BACKEND_SCOPE)
-                    if response.status_code == HTTP_OK:
-                        data = response.json()
-                        if not isinstance(data, dict):
-                            continue
+                    response = client.get(
+                        BACKEND_SCOPE, params={"wait": wait, "version": version}
+                    )
+                    if response.status_code != HTTP_OK:
+                        time.sleep(SCOPE_ERROR_BACKOFF_S)
+                        continue
+
+                    wait = SCOPE_WAIT_S
+                    data = response.json()
+                    if not isinstance(data, dict):
+                        time.sleep(SCOPE_ERROR_BACKOFF_S)
+                        continue
+
+                    version_obj = data.get("version")
+                    if isinstance(version_obj, int):
+                        version = version_obj
+
+                    include_obj = data.get("include")
+                    exclude_obj = data.get("exclude")
+                    if include_obj is None and "patterns" in data:
+                        include_obj = data.get("patterns")
+
+                    drop_obj = data.get("drop")
+
+                    include: list[str] = []
+                    if isinstance(include_obj, list):
+                        include.extend(
+                            p.strip()
+                            for p in include_obj
+                            if isinstance(p, str) and p.strip()
+                        )
 
-                        include_obj = data.get("include")
-                        exclude_obj = data.get("exclude")
-                        if include_obj is None and "patterns" in data:
-                            include_obj = data.get("patterns")
-
-                        drop_obj = data.get("drop")
-
-                        include: list[str] = []
-                        if isinstance(include_obj, list):
-                            include.extend(
-                                p.strip()
-                                for p in include_obj
-                                if isinstance(p, str) and p.strip()
-                            )
-
-                        exclude: list[str] = []
-                        if isinstance(exclude_obj, list):
-                            exclude.extend(
-                                p.strip()
-                                for p in exclude_obj
-                                if isinstance(p, str) and p.strip()
-                            )
-
-                        drop = bool(drop_obj) if isinstance(drop_obj, bool) else False
-
-                        self._set_scope(
-                            include=include or ["*"],
-                            exclude=exclude,
-                            drop=drop,
+                    exclude: list[str] = []
+                    if isinstance(exclude_obj, list):
+                        exclude.extend(
+                            p.strip()
+                            for p in exclude_obj
+                            if isinstance(p, str) and p.strip()
                         )
-                except (httpx.HTTPError, OSError, ValueError):
-                    time.sleep(2.0)
 
-                time.sleep(1.0)
+                    drop = bool(drop_obj) if isinstance(drop_obj, bool) else False
+
+                    self._set_scope(
+                        include=include or ["*"],
+                        exclude=exclude,
+                        drop=drop,
+                    )
+                except (httpx.HTTPError, OSError, ValueError):
+                    time.sleep(SCOPE_ERROR_BACKOFF_S)
 
     def _set_scope(
         self,
@@ -167,39 +285,41 @@ class BridgeAddon:
         exclude: list[str],
         drop: bool,
     ) -> None:
-        include_compiled = [_compile_scope_pattern(p) for p in include]
-        exclude_compiled = [_compile_scope_pattern(p) for p in exclude]
+        # Steady state: the backend returns the same scope every poll tick;
+        # skip the recompile and relock entirely when nothing changed.
+        if (
+            include == self._scope_include
+            and exclude == self._scope_exclude
+            and drop == self._scope_drop
+        ):
+            return
+
+        include_compiled = _compile_scope_matcher(tuple(include))
+        exclude_compiled = _compile_scope_matcher(tuple(exclude))
 
         with self._scope_lock:
             self._scope_include = include
             self._scope_exclude = exclude
             self._scope_drop = drop
-            self._scope_include_regex = include_compiled
-            self._scope_exclude_regex = exclude_compiled
-
-    def _should_drop_out_of_scope(self) -> bool:
-        with self._scope_lock:
-            return self._scope_drop
+            self._scope_snapshot = (include_compiled, exclude_compiled, drop)
 
     def _in_scope(self, url: str) -> bool:
-        with self._scope_lock:
-            include = self._scope_include_regex
-            exclude = self._scope_exclude_regex
-
-        if not include:
-            return True
+        include, exclude, _ = self._scope_snapshot
+        return _in_scope_cached(include, exclude, url)
 
-        if not any(
-            _matches(regex, substring=is_sub, url=url) for regex, is_sub in include
-        ):
-            return False
-
-        return not any(
-            _matches(regex, substring=is_sub, url=url) for regex, is_sub in exclude
-        )
+    def _scope_decision(self, url: str) -> tuple[bool, bool]:
+        # One snapshot read answers both questions the request hook asks:
+        # is the URL in scope, and do we drop it if not.
+        include, exclude, drop = self._scope_snapshot
+        return _in_scope_cached(include, exclude, url), drop
 
     def request(self, flow: http.HTTPFlow) -> None:
-        token, new_url = _strip_replay_param(flow.request.pretty_url)
+        # Almost no URL carries the replay token; a substring probe spares
+        # the urlsplit/parse_qsl/urlencode round-trip on the common path.
+        token: str | None = None
+        new_url: str | None = None
+        if REPLAY_PARAM in flow.request.pretty_url:
+            token, new_url = _strip_replay_param(flow.request.pretty_url)
         if token is not None and new_url is not None:
             spec = self._fetch_replay_spec(token)
             if (
@@ -214,10 +334,10 @@ class BridgeAddon:
                     flow.request.headers.add(key, value)
 
         url = flow.request.pretty_url
-        in_scope = self._in_scope(url)
+        in_scope, drop_out = self._scope_decision(url)
         flow.metadata["nsp_in_scope"] = in_scope
 
-        if not in_scope and self._should_drop_out_of_scope():
+        if not in_scope and drop_out:
             flow.kill()  # type: ignore[no-untyped-call]
 
     def response(self, flow: http.HTTPFlow) -> None:
@@ -231,8 +351,8 @@ class BridgeAddon:
 
         compact, resp_body_b64 = flow_ingest(flow)
         payload = self._encode_payload(compact, resp_body_b64=resp_body_b64)
-        with suppress(queue.Full):
-            self._queue.put_nowait(payload)
+        self._queue.append(payload)
+        self._queue_event.set()
 
     def _fetch_replay_spec(self, token: str) -> ReplaySpec | None:
         try:
@@ -259,16 +379,17 @@ class BridgeAddon:
                     and isinstance(headers, list)
                     and isinstance(body, str)
                 ):
-                    header_pairs = [
-                        (item[0], item[1])
-                        for item in headers
-                        if (
-                            isinstance(item, (list, tuple))
-                            and len(item) == HEADER_PAIR_LEN
-                            and isinstance(item[0], str)
-                            and isinstance(item[1], str)
-                        )
-                    ]
+                    # Let the unpack do the shape check: the backend sends
+                    # two-element lists, so the happy path is one tuple
+                    # assignment instead of isinstance/len/index per item.
+                    header_pairs: list[tuple[str, str]] = []
+                    for item in headers:
+                        try:
+                            key, value = item
+                        except (TypeError, ValueError):
+                            continue
+                        if type(key) is str and type(value) is str:
+                            header_pairs.append((key, value))
 
                     spec = ReplaySpec(
                         method=method.upper(),
@@ -280,11 +401,8 @@ class BridgeAddon:
         return spec
 
     @staticmethod
-    def _encode_payload(flow: FlowCompact, *, resp_body_b64: str | None) -> str:
-        data = dataclasses.asdict(flow)
-        data["resp_body_b64"] = resp_body_b64
-        envelope = {"type": "flow", "data": data}
-        return json.dumps(envelope, ensure_ascii=False, separators=(",", ":"))
+    def _encode_payload(flow: FlowCompact, *, resp_body_b64: str | None) -> bytes:
+        return _encode_flow_payload(flow, resp_body_b64)
 
 
 addons = [BridgeAddon()]
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
-import base64
-import json
+import binascii
+import functools
 import re
 import time
 from typing import TYPE_CHECKING
 
+import orjson
+
 from noshitproxy.models import FlowCompact
 
 if TYPE_CHECKING:
@@ -16,10 +18,17 @@ MAX_REQ_BODY_STORE = 256 * 1024
 MAX_RESP_BODY_STORE = 2 * 1024 * 1024
 MAX_FORMAT_BYTES = 256 * 1024
 
-_CHARSET_RE = re.compile(r"charset=([^;]+)", re.IGNORECASE)
+# Callers fold the content type to lowercase first, so no IGNORECASE - the
+# case-sensitive program is simpler for the engine to run.
+_CHARSET_RE = re.compile(r"charset=([^;]+)")
 
 
+@functools.lru_cache(maxsize=256)
 def _charset_from_content_type(content_type: str | None) -> str:
+    # Pure str -> str, and real traffic cycles through a handful of distinct
+    # Content-Type spellings, so the steady state is a dict probe on the
+    # cache; the regex below is only the miss path for values never seen
+    # before.
     if content_type is None:
         return "utf-8"
 
@@ -31,10 +40,20 @@ def _charset_from_content_type(content_type: str | None) -> str:
     return charset or "utf-8"
 
 
+def _b64_str(data: bytes) -> str:
+    # b2a_base64 is what base64.b64encode wraps; calling it directly skips
+    # the wrapper frame, which matters on multi-MB response bodies.
+    return binascii.b2a_base64(data, newline=False).decode("ascii")
+
+
 def _safe_decode(data: bytes, limit: int, charset: str) -> str | None:
     if not data:
         return None
-    return data[:limit].decode(charset, "replace")
+    if len(data) <= limit:
+        return data.decode(charset, "replace")
+    # Decode straight out of a memoryview slice so the truncated prefix is
+    # never materialized as its own bytes object.
+    return str(memoryview(data)[:limit], charset, "replace")
 
 
 def _headers_to_list(
@@ -42,22 +61,30 @@ def _headers_to_list(
     *,
     collapse_cookie: bool,
 ) -> list[tuple[str, str]]:
-    out: list[tuple[str, str]] = []
+    # latin-1 maps header octets 1:1 to code points with no validation pass
+    # (HTTP/1.1 defines the field charset as ISO-8859-1 anyway), and the
+    # cookie probe runs on the raw bytes so nothing is lowercased as str.
+    fields = headers.fields
+    if not collapse_cookie or not any(
+        key_raw.lower() == b"cookie" for key_raw, _ in fields
+    ):
+        return [
+            (key_raw.decode("latin-1"), value_raw.decode("latin-1"))
+            for key_raw, value_raw in fields
+        ]
 
+    out: list[tuple[str, str]] = []
     cookie_index: int | None = None
     cookie_parts: list[str] = []
 
-    for key_raw, value_raw in headers.fields:
-        key = key_raw.decode("utf-8", "replace")
-        value = value_raw.decode("utf-8", "replace")
-
-        if collapse_cookie and key.lower() == "cookie":
+    for key_raw, value_raw in fields:
+        if key_raw.lower() == b"cookie":
             if cookie_index is None:
                 cookie_index = len(out)
-            cookie_parts.append(value.strip())
+            cookie_parts.append(value_raw.decode("latin-1").strip())
             continue
 
-        out.append((key, value))
+        out.append((key_raw.decode("latin-1"), value_raw.decode("latin-1")))
 
     if cookie_index is not None:
         cookie_value = "; ".join(part for part in cookie_parts if part)
@@ -67,25 +94,47 @@ def _headers_to_list(
     return out
 
 
+_JSON_WS = frozenset(b" \t\r\n")
+_JSON_OPENERS = frozenset(b"{[")
+
+
+def _looks_like_json(data: bytes) -> bool:
+    # First non-whitespace byte decides: anything not opening an object or
+    # array (HTML error pages served as json, plain-text bodies) skips the
+    # doomed parse-and-except round trip. Indexing walks in place, so the
+    # typical zero-whitespace prefix costs one probe and no copy.
+    i = 0
+    end = len(data)
+    while i < end and data[i] in _JSON_WS:
+        i += 1
+    return i < end and data[i] in _JSON_OPENERS
+
+
 def _preview_text(data: bytes, *, content_type: str | None) -> str | None:
     if not data:
         return None
 
-    charset = _charset_from_content_type(content_type)
-
-    is_json = content_type is not None and "json" in content_type.lower()
-
-    if is_json and len(data) <= MAX_FORMAT_BYTES:
-        raw = data.decode(charset, "replace")
+    # One lowercase serves both the json sniff and the charset parse (and
+    # folds the charset cache keys while at it).
+    ct_lower = content_type.lower() if content_type is not None else None
+
+    if (
+        ct_lower is not None
+        and "json" in ct_lower
+        and len(data) <= MAX_FORMAT_BYTES
+        and _looks_like_json(data)
+    ):
+        # orjson parses the raw bytes directly (JSON is UTF-8 by definition),
+        # so the decode-to-str pass before parsing disappears.
         try:
-            loaded: object = json.loads(raw)
-        except json.JSONDecodeError:
-            return _safe_decode(data, MAX_PREVIEW, charset)
+            loaded: object = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return _safe_decode(data, MAX_PREVIEW, _charset_from_content_type(ct_lower))
 
-        formatted = json.dumps(loaded, ensure_ascii=False, indent=2)
+        formatted = orjson.dumps(loaded, option=orjson.OPT_INDENT_2).decode()
         return formatted[:MAX_PREVIEW]
 
-    return _safe_decode(data, MAX_PREVIEW, charset)
+    return _safe_decode(data, MAX_PREVIEW, _charset_from_content_type(ct_lower))
 
 
 def flow_ingest(flow: http.HTTPFlow) -> tuple[FlowCompact, str | None]:
@@ -93,16 +142,21 @@ def flow_ingest(flow: http.HTTPFlow) -> tuple[FlowCompact, str | None]:
     response = flow.response
 
     request_raw = request.raw_content or b""
-    request_content = request.get_content(strict=False) or b""
+    request_size = len(request_raw)
+    # get_content may decode Content-Encoding into a second buffer; skip it
+    # outright for bodyless requests (the overwhelmingly common case).
+    request_content = (request.get_content(strict=False) or b"") if request_raw else b""
 
     request_content_type = request.headers.get("content-type")
 
-    response_raw = b""
+    response_size = 0
     response_content = b""
     response_content_type: str | None = None
     if response is not None:
-        response_raw = response.raw_content or b""
-        response_content = response.get_content(strict=False) or b""
+        # Only the length of the raw body is needed; don't keep it alive.
+        response_size = len(response.raw_content or b"")
+        if response_size:
+            response_content = response.get_content(strict=False) or b""
         response_content_type = response.headers.get("content-type")
 
     ts_value = getattr(flow, "timestamp_start", None)
@@ -115,14 +169,14 @@ def flow_ingest(flow: http.HTTPFlow) -> tuple[FlowCompact, str | None]:
             duration = round(ts_end - ts, 3)
 
     request_body_b64: str | None
-    if request_raw and len(request_raw) <= MAX_REQ_BODY_STORE:
-        request_body_b64 = base64.b64encode(request_raw).decode("ascii")
+    if request_raw and request_size <= MAX_REQ_BODY_STORE:
+        request_body_b64 = _b64_str(request_raw)
     else:
         request_body_b64 = None
 
     resp_body_b64: str | None = None
     if response_content and len(response_content) <= MAX_RESP_BODY_STORE:
-        resp_body_b64 = base64.b64encode(response_content).decode("ascii")
+        resp_body_b64 = _b64_str(response_content)
 
     compact = FlowCompact(
         id=flow.id,
@@ -137,8 +191,8 @@ def flow_ingest(flow: http.HTTPFlow) -> tuple[FlowCompact, str | None]:
         resp_headers=_headers_to_list(response.headers, collapse_cookie=False)
         if response is not None
         else [],
-        req_size=len(request_raw),
-        resp_size=len(response_raw),
+        req_size=request_size,
+        resp_size=response_size,
         req_body_b64=request_body_b64,
         req_preview=_preview_text(request_content, content_type=request_content_type),
         resp_preview=_preview_text(